@@ -2,9 +2,17 @@ import streamlit as st
 import networkx as nx
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
+from collections import defaultdict
+from itertools import combinations
 from typing import List, Tuple, Dict
 from matplotlib.colors import CSS4_COLORS  # To convert color names to hex codes
 
+try:
+    from numba import njit  # Optional, speeds up coloring on large graphs
+except ImportError:
+    njit = None
+
 # Constants
 COURSES = [
     "Math", "Science", "History", "English", "Art", "Music", "Geography", "Biology",
@@ -13,7 +21,7 @@ COURSES = [
 ]
 
 # Convert color names to hex codes
-DEFAULT_COLORS = [CSS4_COLORS[color_name] for color_name in [
+DEFAULT_COLORS = tuple(CSS4_COLORS[color_name] for color_name in [
     'aliceblue', 'antiquewhite', 'aqua', 'aquamarine', 'azure', 'beige', 'bisque',
     'blanchedalmond', 'blue', 'blueviolet', 'brown', 'burlywood', 'cadetblue', 'chartreuse',
     'chocolate', 'coral', 'cornflowerblue', 'cornsilk', 'crimson', 'cyan', 'darkblue',
@@ -22,7 +30,14 @@ DEFAULT_COLORS = [CSS4_COLORS[color_name] for color_name in [
     'darkslategray', 'darkturquoise', 'darkviolet', 'deeppink', 'deepskyblue', 'dimgray',
     'dodgerblue', 'firebrick', 'floralwhite', 'forestgreen', 'fuchsia', 'gainsboro',
     'ghostwhite', 'gold', 'goldenrod', 'lightgray', 'lightgreen', 'greenyellow'
-]]
+])
+NUM_DEFAULT_COLORS = len(DEFAULT_COLORS)
+
+# Kamada-Kawai is O(N^2); above this many nodes fall back to a random layout
+KAMADA_KAWAI_MAX_NODES = 1000
+
+# Above this many nodes plus edges, render the graph with WebGL instead of SVG
+WEBGL_MIN_ELEMENTS = 500
 
 # Streamlit App Title
 st.title("Exam Scheduling via Welsh Powell Algorithm")
@@ -39,6 +54,7 @@ font_size = st.sidebar.slider("Font Size", min_value=8, max_value=20, value=10)
 def input_courses(student: int, courses: List[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
     """
     Prompts the user to input courses for a student and creates cyclic edges between them.
+    Widgets are placed in the current container, i.e. the sidebar student form.
 
     Args:
         student (int): The student number.
@@ -47,8 +63,8 @@ def input_courses(student: int, courses: List[str]) -> Tuple[List[str], List[Tup
     Returns:
         Tuple[List[str], List[Tuple[str, str]]]: A tuple containing the selected courses and the edges created.
     """
-    st.sidebar.subheader(f"Student {student}")
-    selected_courses = st.sidebar.multiselect(
+    st.subheader(f"Student {student}")
+    selected_courses = st.multiselect(
         f"Select courses for Student {student}",
         courses,
         key=f"student_courses_{student}"  # Changed to more unique key
@@ -56,17 +72,48 @@ def input_courses(student: int, courses: List[str]) -> Tuple[List[str], List[Tup
 
     # Validate input
     if not selected_courses:
-        st.sidebar.error(f"Student {student}: Please select at least one course.")
+        st.error(f"Student {student}: Please select at least one course.")
         return [], []
 
     # Create edges between ALL pairs of courses (fully connected subgraph)
-    edges = []
-    for i in range(len(selected_courses)):
-        for j in range(i + 1, len(selected_courses)):
-            edges.append((selected_courses[i], selected_courses[j]))
+    edges = list(combinations(selected_courses, 2))
 
     return selected_courses, edges
 
+def _welsh_powell(indptr: np.ndarray, indices: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """
+    Colors the vertices of a graph in CSR form in the given order, using the smallest color not taken by a neighbor.
+
+    Args:
+        indptr (np.ndarray): CSR row pointers of the adjacency matrix.
+        indices (np.ndarray): CSR column indices of the adjacency matrix.
+        order (np.ndarray): The vertices in the order they should be colored.
+
+    Returns:
+        np.ndarray: The color assigned to each vertex.
+    """
+    n = order.shape[0]
+    colors = np.full(n, -1, np.int32)
+    used = np.zeros(n + 1, np.bool_)
+    for v in order:
+        for k in range(indptr[v], indptr[v + 1]):
+            c = colors[indices[k]]
+            if c >= 0:
+                used[c] = True
+        c = 0
+        while used[c]:
+            c += 1
+        colors[v] = c
+        # Clear only the flags set for this vertex
+        for k in range(indptr[v], indptr[v + 1]):
+            c = colors[indices[k]]
+            if c >= 0:
+                used[c] = False
+    return colors
+
+if njit is not None:
+    _welsh_powell = njit(cache=True)(_welsh_powell)
+
 def greedy_coloring(graph: nx.Graph) -> Dict[str, int]:
     """
     Applies the greedy coloring algorithm (Welsh Powell) to the graph.
@@ -77,7 +124,51 @@ def greedy_coloring(graph: nx.Graph) -> Dict[str, int]:
     Returns:
         Dict[str, int]: A dictionary mapping each node to its assigned color.
     """
-    return nx.coloring.greedy_color(graph, strategy="largest_first")
+    if njit is None:
+        return nx.coloring.greedy_color(graph, strategy="largest_first")
+
+    # Build the CSR adjacency of the graph
+    nodes = list(graph.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    degrees = np.fromiter((graph.degree(node) for node in nodes), dtype=np.int64, count=len(nodes))
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = np.fromiter((index[neighbor] for node in nodes for neighbor in graph.adj[node]),
+                          dtype=np.int64, count=int(indptr[-1]))
+
+    # Largest degree first, ties broken by insertion order as in NetworkX
+    order = np.argsort(-degrees, kind="stable")
+    colors = _welsh_powell(indptr, indices, order)
+
+    return {nodes[v]: int(colors[v]) for v in order}
+
+def build_graph(edges: Tuple[Tuple[str, str], ...]) -> nx.Graph:
+    """
+    Builds the conflict graph over all courses from the given edges.
+
+    Args:
+        edges (Tuple[Tuple[str, str], ...]): The conflict edges between courses.
+
+    Returns:
+        nx.Graph: The conflict graph.
+    """
+    graph = nx.Graph()
+    graph.add_nodes_from(COURSES)
+    graph.add_edges_from(edges)
+    return graph
+
+@st.cache_data(show_spinner=False)
+def build_graph_and_color(edges: Tuple[Tuple[str, str], ...]) -> Dict[str, int]:
+    """
+    Builds the conflict graph and colors it, cached across Streamlit reruns.
+
+    Args:
+        edges (Tuple[Tuple[str, str], ...]): The conflict edges between courses, sorted and deduplicated.
+
+    Returns:
+        Dict[str, int]: A dictionary mapping each course to its assigned color.
+    """
+    return greedy_coloring(build_graph(edges))
 
 def create_schedule_table(coloring: Dict[str, int]) -> pd.DataFrame:
     """
@@ -89,58 +180,104 @@ def create_schedule_table(coloring: Dict[str, int]) -> pd.DataFrame:
     Returns:
         pd.DataFrame: A DataFrame representing the schedule.
     """
-    schedule = {}
+    # Group courses by day, tracking the longest day as we go
+    schedule = defaultdict(list)
+    max_courses = 0
     for course, day in coloring.items():
-        day_name = f"Day {day + 1}"
-        if day_name not in schedule:
-            schedule[day_name] = []
-        schedule[day_name].append(course)
+        day_courses = schedule[f"Day {day + 1}"]
+        day_courses.append(course)
+        if len(day_courses) > max_courses:
+            max_courses = len(day_courses)
 
-    # Convert to DataFrame
-    max_courses = max(len(courses) for courses in schedule.values())
-    for day in schedule:
-        schedule[day] += [""] * (max_courses - len(schedule[day]))
+    # Pad shorter days with empty cells
+    return pd.DataFrame({day: courses + [""] * (max_courses - len(courses)) for day, courses in schedule.items()})
 
-    return pd.DataFrame(schedule)
+@st.cache_data(show_spinner=False)
+def compute_layout(nodes: Tuple[str, ...], edges: Tuple[Tuple[str, str], ...], layout: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Computes node positions for the graph, cached across Streamlit reruns.
 
-def visualize_graph(graph: nx.Graph, coloring: Dict[str, int], layout: str, custom_colors: List[str], node_size: int, font_size: int):
+    Args:
+        nodes (Tuple[str, ...]): The nodes of the graph, in insertion order.
+        edges (Tuple[Tuple[str, str], ...]): The edges of the graph, sorted.
+        layout (str): The layout to use for the graph.
+
+    Returns:
+        Dict[str, Tuple[float, float]]: A dictionary mapping each node to its (x, y) position.
+    """
+    graph = nx.Graph()
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from(edges)
+
+    # Fixed seeds keep the positions stable for the cache
+    if layout == "Spring":
+        pos = nx.spring_layout(graph, scale=1.0, seed=0)
+    elif layout == "Circular":
+        pos = nx.circular_layout(graph, scale=1.0)
+    elif layout == "Kamada-Kawai":
+        pos = nx.kamada_kawai_layout(graph, scale=1.0)
+    elif layout == "Random":
+        pos = nx.random_layout(graph, seed=0)
+
+    return {node: (float(x), float(y)) for node, (x, y) in pos.items()}
+
+def visualize_graph(graph: nx.Graph, edges: Tuple[Tuple[str, str], ...], coloring: Dict[str, int], layout: str, custom_colors: List[str], node_size: int, font_size: int):
     """
     Visualizes the graph with node colors based on the greedy coloring result using Plotly.
 
     Args:
         graph (nx.Graph): The graph to be visualized.
+        edges (Tuple[Tuple[str, str], ...]): The edges of the graph, sorted and deduplicated.
         coloring (Dict[str, int]): A dictionary mapping each node to its assigned color.
         layout (str): The layout to use for the graph.
         custom_colors (List[str]): List of custom colors for each day.
         node_size (int): Size of the nodes.
         font_size (int): Size of the font for node labels.
     """
-    if layout == "Spring":
-        pos = nx.spring_layout(graph)
-    elif layout == "Circular":
-        pos = nx.circular_layout(graph)
-    elif layout == "Kamada-Kawai":
-        pos = nx.kamada_kawai_layout(graph)
-
-    edge_traces = []
-    for edge in graph.edges():
-        x0, y0 = pos[edge[0]]
-        x1, y1 = pos[edge[1]]
-        edge_traces.append(go.Scatter(
-            x=[x0, x1], y=[y0, y1],
-            mode="lines",
-            line=dict(width=0.5, color="gray"),
-            hoverinfo="none"
-        ))
-
-    node_trace = go.Scatter(
-        x=[pos[course][0] for course in graph.nodes()],
-        y=[pos[course][1] for course in graph.nodes()],
+    # Kamada-Kawai becomes too slow on large graphs
+    n = graph.number_of_nodes()
+    if layout == "Kamada-Kawai" and n > KAMADA_KAWAI_MAX_NODES:
+        st.warning(f"Kamada-Kawai layout is too slow for {n} courses. Using a random layout instead.")
+        layout = "Random"
+
+    # Layouts only depend on the graph structure, so reuse them across reruns
+    node_list = list(graph.nodes())
+    pos = compute_layout(tuple(node_list), edges, layout)
+
+    # WebGL scales to large graphs, SVG renders text more cleanly on small ones
+    if n + len(edges) > WEBGL_MIN_ELEMENTS:
+        scatter = go.Scattergl
+    else:
+        scatter = go.Scatter
+
+    # Draw all edges as a single trace, with None separating the segments
+    edge_x = []
+    edge_y = []
+    for u, v in edges:
+        edge_x += [pos[u][0], pos[v][0], None]
+        edge_y += [pos[u][1], pos[v][1], None]
+
+    edge_trace = scatter(
+        x=edge_x, y=edge_y,
+        mode="lines",
+        line=dict(width=0.5, color="gray"),
+        hoverinfo="none"
+    )
+
+    # Gather node positions and days into contiguous arrays
+    coords = np.fromiter((v for course in node_list for v in pos[course]), dtype=np.float64, count=2 * n).reshape(-1, 2)
+    days = np.fromiter((coloring[course] for course in node_list), dtype=np.int64, count=n)
+    node_text = [f"{course} (Day {day + 1})" for course, day in zip(node_list, days.tolist())]
+    node_colors = [custom_colors[i] for i in (days % len(custom_colors)).tolist()]
+
+    node_trace = scatter(
+        x=coords[:, 0],
+        y=coords[:, 1],
         mode="markers+text",
-        text=[f"{course} (Day {coloring[course] + 1})" for course in graph.nodes()],
+        text=node_text,
         marker=dict(
             size=node_size,
-            color=[custom_colors[coloring[course] % len(custom_colors)] for course in graph.nodes()],
+            color=node_colors,
             line=dict(width=2, color="black")
         ),
         textposition="top center",
@@ -148,7 +285,7 @@ def visualize_graph(graph: nx.Graph, coloring: Dict[str, int], layout: str, cust
         textfont=dict(size=font_size)
     )
 
-    fig = go.Figure(data=edge_traces + [node_trace], layout=go.Layout(
+    fig = go.Figure(data=[edge_trace, node_trace], layout=go.Layout(
         showlegend=False,
         hovermode="closest",
         margin=dict(b=0, l=0, r=0, t=0),
@@ -180,10 +317,12 @@ def create_course_day_mapping(schedule):
     Returns:
     dict: A dictionary mapping course names to lists of days
     """
+    # Parse the day numbers from the "Day N" column names once
+    day_nums = {day_col: int(day_col[4:]) for day_col in schedule.columns}
+
     course_to_days = {}
-    for day_col in schedule.columns:
-        day_num = int(day_col.split(" ")[1])
-        for course in schedule[day_col]:
+    for day_col, day_num in day_nums.items():
+        for course in schedule[day_col].to_numpy():
             if course and course.strip():
                 if course not in course_to_days:
                     course_to_days[course] = []
@@ -194,22 +333,36 @@ def main():
     """
     Main function to execute the program.
     """
-    # Create the graph
-    G = nx.Graph()
-    G.add_nodes_from(COURSES)
+    # Collect course selections in a form so the graph only changes on submit
+    with st.sidebar.form("student_courses_form"):
+        selections = [input_courses(student, COURSES) for student in range(1, num_students + 1)]
+        submitted = st.form_submit_button("Apply Course Selections")
 
-    # Generate and add edges based on user input for each student
+    # Generate edges based on user input for each student
     # Store student course selections for conflict detection
-    student_courses = {}
-    for student in range(1, num_students + 1):
-        selected_courses, edges = input_courses(student, COURSES)
-        if selected_courses:  # Only add edges if courses are selected
-            G.add_edges_from(edges)
-            student_courses[f"Student {student}"] = selected_courses
-
-    # Perform greedy coloring
-    course_coloring = greedy_coloring(G)
-    chromatic_number = max(course_coloring.values()) + 1
+    if submitted or st.session_state.get("student_count") != num_students or "conflict_edges" not in st.session_state:
+        student_courses = {}
+        all_edges = set()
+        for student, (selected_courses, edges) in enumerate(selections, start=1):
+            if selected_courses:  # Only add edges if courses are selected
+                all_edges.update(tuple(sorted(edge)) for edge in edges)
+                student_courses[f"Student {student}"] = selected_courses
+        st.session_state.student_courses = student_courses
+        st.session_state.conflict_edges = tuple(sorted(all_edges))
+        st.session_state.student_count = num_students
+
+    student_courses = st.session_state.student_courses
+    edges = st.session_state.conflict_edges
+
+    # Create the graph and perform greedy coloring, reusing the coloring if the edges are unchanged
+    G = build_graph(edges)
+    if G.number_of_edges() == 0:
+        # Without conflicts every course fits on the first day
+        course_coloring = {course: 0 for course in COURSES}
+        chromatic_number = 1
+    else:
+        course_coloring = build_graph_and_color(edges)
+        chromatic_number = max(course_coloring.values()) + 1
 
     # Display chromatic number with improved formatting
     st.markdown(f"<div style='padding: 10px; background-color: #007AE8; border-radius: 5px;'>"
@@ -220,7 +373,7 @@ def main():
     st.sidebar.subheader("Customize Colors")
     custom_colors = []
     for i in range(chromatic_number):
-        color = st.sidebar.color_picker(f"Color for Day {i + 1}", DEFAULT_COLORS[i % len(DEFAULT_COLORS)])
+        color = st.sidebar.color_picker(f"Color for Day {i + 1}", DEFAULT_COLORS[i % NUM_DEFAULT_COLORS])
         custom_colors.append(color)
 
     # Graph Layout Options
@@ -271,8 +424,8 @@ def main():
         # Display detailed errors in a clear, bulleted list
         if "multi_day" in st.session_state.validation_errors:
             st.markdown("**Courses scheduled on multiple days:**")
-            # Create a mapping of courses to their scheduled days for error display
-            course_to_days = create_course_day_mapping(st.session_state.edited_schedule)
+            # Use the mapping of courses to their scheduled days stored during validation
+            course_to_days = st.session_state.course_to_days
             for course in st.session_state.validation_errors["multi_day"]:
                 days = ", ".join([f"Day {day}" for day in course_to_days[course]])
                 st.markdown(f"- {course} is scheduled on {days}")
@@ -290,21 +443,18 @@ def main():
 
     # Display styled dataframe with conflicts highlighted if there are errors
     if st.session_state.validation_errors:
-        # Get list of all courses with errors
-        error_courses = []
+        # Get set of all courses with errors
+        error_courses = set()
         for error_type, courses in st.session_state.validation_errors.items():
-            error_courses.extend(courses)
+            error_courses.update(courses)
 
-        # Define a row-wise function for styling
-        def highlight_errors(row):
-            styles = [''] * len(row)
-            for i, val in enumerate(row):
-                if val in error_courses:
-                    styles[i] = 'background-color: #FF1F33'
-            return styles
+        # Precompute the cell styles from a mask of the conflicting courses
+        error_mask = edited_df.isin(error_courses)
+        error_styles = pd.DataFrame(np.where(error_mask, 'background-color: #FF1F33', ''),
+                                    index=edited_df.index, columns=edited_df.columns)
 
         # Apply styling to dataframe
-        styled_df = edited_df.style.apply(highlight_errors, axis=1)
+        styled_df = edited_df.style.apply(lambda _: error_styles, axis=None)
 
         # Display styled dataframe (read-only)
         st.write("Schedule with conflicts highlighted in red:")
@@ -357,6 +507,9 @@ def main():
         # Create a mapping of courses to their scheduled days
         course_to_days = create_course_day_mapping(schedule_to_validate)
 
+        # Store the mapping in session state for the error display
+        st.session_state.course_to_days = course_to_days
+
         # 1. Check for courses scheduled on multiple days
         multi_day_courses = []
         for course, days in course_to_days.items():
@@ -370,38 +523,28 @@ def main():
         student_conflicts = {}
 
         for student, courses in student_courses.items():
-            # Get days for each of the student's courses
+            # Group this student's courses by the days they are scheduled on
+            student_days = defaultdict(list)
             for course in courses:
-                if course in course_to_days:
-                    # Check each day this course is scheduled
-                    for day in course_to_days[course]:
-                        # Find other courses for this student on the same day
-                        same_day_courses = [c for c in courses if c in course_to_days and day in course_to_days[c] and c != course]
-
-                        if same_day_courses:
-                            if student not in student_conflicts:
-                                student_conflicts[student] = {}
-
-                            if day not in student_conflicts[student]:
-                                student_conflicts[student][day] = []
+                for day in dict.fromkeys(course_to_days.get(course, [])):
+                    student_days[day].append(course)
 
-                            # Add this course and conflicts to the list
-                            conflict_set = set(same_day_courses + [course])
-                            for c in conflict_set:
-                                if c not in student_conflicts[student][day]:
-                                    student_conflicts[student][day].append(c)
+            # Any day with two or more of the student's courses is a conflict
+            conflict_days = {day: day_courses for day, day_courses in student_days.items() if len(day_courses) > 1}
+            if conflict_days:
+                student_conflicts[student] = conflict_days
 
         # Store the conflicts in session state for display
         st.session_state.student_conflicts = student_conflicts
 
         # Collect all courses involved in student conflicts
-        student_conflict_courses = []
+        student_conflict_courses = set()
         for student, days in student_conflicts.items():
             for day, courses in days.items():
-                student_conflict_courses.extend(courses)
+                student_conflict_courses.update(courses)
 
         if student_conflict_courses:
-            st.session_state.validation_errors["student_conflicts"] = list(set(student_conflict_courses))
+            st.session_state.validation_errors["student_conflicts"] = list(student_conflict_courses)
 
         # Display validation results
         if st.session_state.validation_errors:
@@ -427,7 +570,7 @@ def main():
 
     # Visualize the graph
     st.subheader("Graph Visualization")
-    visualize_graph(G, course_coloring, selected_layout, custom_colors, node_size, font_size)
+    visualize_graph(G, edges, course_coloring, selected_layout, custom_colors, node_size, font_size)
 
 if __name__ == "__main__":
     main()